@@ -52,6 +52,10 @@ WSGI_APPLICATION = "shiv_budget.wsgi.application"
 
 DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": BASE_DIR / "db.sqlite3"}}
 
+# Sessions record the backend that logged them in, so sessions created under
+# django.contrib.auth.backends.ModelBackend end when this list no longer names it.
+AUTHENTICATION_BACKENDS = ["shiv_erp.backends.ContactProfileBackend"]
+
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
     {"NAME": "django.contrib.auth.password_validation.MinimumLengthValidator"},
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+from decimal import Decimal
+
 from django.contrib import admin
 from django.contrib import messages
 from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.http import HttpRequest
+from django.urls import reverse
+from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 
 from .models import (
@@ -18,7 +22,9 @@ from .models import (
     DocumentLine,
     Payment,
     Product,
+    defer_totals_recalculation,
 )
+from .services import load_auto_analytical_rules
 
 
 class DocumentInline(admin.TabularInline):
@@ -30,7 +36,15 @@ class DocumentInline(admin.TabularInline):
     show_change_link = True
     classes = ["collapse"]
     verbose_name = _("Related Document")
-    verbose_name_plural = _("Related Documents")
+    verbose_name_plural = _("Recent Documents")
+    recent_limit = 25
+
+    def get_queryset(self, request: HttpRequest):
+        return (
+            super()
+            .get_queryset(request)
+            .only("id", "contact", "number", "doc_type", "issue_date", "status", "total_amount", "payment_status")
+        )
 
 
 @admin.register(Contact)
@@ -38,8 +52,28 @@ class ContactAdmin(admin.ModelAdmin):
     list_display = ("name", "contact_type", "email", "phone", "is_active")
     list_filter = ("contact_type", "is_active")
     search_fields = ("name", "email", "phone")
+    readonly_fields = ("documents_link",)
     inlines = [DocumentInline]
 
+    def get_formset_kwargs(self, request: HttpRequest, obj: Contact, inline, prefix: str) -> dict:
+        kwargs = super().get_formset_kwargs(request, obj, inline, prefix)
+        if isinstance(inline, DocumentInline) and obj.pk:
+            recent_ids = list(
+                Document.objects.filter(contact=obj)
+                .order_by("-issue_date", "-created_at")
+                .values_list("pk", flat=True)[: DocumentInline.recent_limit]
+            )
+            kwargs["queryset"] = kwargs["queryset"].filter(pk__in=recent_ids)
+        return kwargs
+
+    @admin.display(description=_("Documents"))
+    def documents_link(self, obj: Contact) -> str:
+        if not obj.pk:
+            return "-"
+        count = obj.documents.count()
+        url = f"{reverse('admin:shiv_erp_document_changelist')}?contact__id__exact={obj.pk}"
+        return format_html('<a href="{}">{}</a>', url, _("View %(count)s documents") % {"count": count})
+
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
@@ -77,6 +111,13 @@ class BudgetAdmin(admin.ModelAdmin):
     search_fields = ("analytic_account__name", "analytic_account__code", "period__name")
     inlines = [BudgetRevisionInline]
 
+    def get_queryset(self, request: HttpRequest):
+        return super().get_queryset(request).select_related("analytic_account", "period").with_actuals()
+
+    @admin.display(description=_("Actual amount"), ordering="actual_amount_db")
+    def actual_amount(self, obj: Budget) -> Decimal:
+        return obj.actual_amount
+
     def save_model(self, request: HttpRequest, obj: Budget, form, change: bool) -> None:
         previous_amount = None
         if change and obj.pk:
@@ -99,6 +140,7 @@ class AutoAnalyticalRuleAdmin(admin.ModelAdmin):
         "is_active",
     )
     list_filter = ("transaction_type", "is_active")
+    list_select_related = ("match_contact", "match_product", "assign_analytic_account")
     search_fields = ("name", "match_product_category", "assign_analytic_account__name")
 
 
@@ -108,29 +150,43 @@ class DocumentLineInline(admin.TabularInline):
     fields = ("product", "description", "quantity", "unit_price", "line_total", "analytic_account")
     readonly_fields = ("line_total",)
 
+    def get_queryset(self, request: HttpRequest):
+        return super().get_queryset(request).select_related("product", "analytic_account")
+
 
 class PaymentInline(admin.TabularInline):
     model = Payment
     extra = 0
     fields = ("payment_date", "method", "amount", "status")
 
+    def get_queryset(self, request: HttpRequest):
+        return super().get_queryset(request).select_related("document")
+
 
 @admin.action(description=_("Confirm selected documents"))
 def confirm_documents(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset):
-    for doc in queryset:
-        try:
-            doc.confirm()
-        except ValidationError as e:
-            modeladmin.message_user(request, f"{doc}: {e}", level=messages.ERROR)
+    documents = list(queryset)
+    rules = load_auto_analytical_rules({doc.doc_type for doc in documents})
+    with transaction.atomic():
+        for doc in documents:
+            try:
+                with transaction.atomic():
+                    doc.confirm(rules=rules)
+            except ValidationError as e:
+                modeladmin.message_user(request, f"{doc}: {e}", level=messages.ERROR)
 
 
 @admin.action(description=_("Post selected invoices/bills"))
 def post_documents(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset):
-    for doc in queryset:
-        try:
-            doc.post()
-        except ValidationError as e:
-            modeladmin.message_user(request, f"{doc}: {e}", level=messages.ERROR)
+    documents = list(queryset)
+    rules = load_auto_analytical_rules({doc.doc_type for doc in documents})
+    with transaction.atomic():
+        for doc in documents:
+            try:
+                with transaction.atomic():
+                    doc.post(rules=rules)
+            except ValidationError as e:
+                modeladmin.message_user(request, f"{doc}: {e}", level=messages.ERROR)
 
 
 @admin.register(Document)
@@ -141,17 +197,22 @@ class DocumentAdmin(admin.ModelAdmin):
     date_hierarchy = "issue_date"
     inlines = [DocumentLineInline, PaymentInline]
     actions = [confirm_documents, post_documents]
+    show_full_result_count = False
+
+    def get_queryset(self, request: HttpRequest):
+        return super().get_queryset(request).select_related("contact")
 
     def save_related(self, request: HttpRequest, form, formsets, change: bool) -> None:
         with transaction.atomic():
-            super().save_related(request, form, formsets, change)
+            with defer_totals_recalculation():
+                super().save_related(request, form, formsets, change)
             doc: Document = form.instance
             doc.recalculate_totals()
-            doc.save()
 
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ("document", "payment_date", "method", "amount", "status")
     list_filter = ("method", "status")
+    list_select_related = ("document",)
     search_fields = ("document__number", "document__contact__name")
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+UserModel = get_user_model()
+
+
+class _ContactProfileUserManager(type(UserModel._default_manager)):
+    # Same class as the default manager, so get_by_natural_key() keeps its behaviour.
+    def get_queryset(self):
+        return super().get_queryset().select_related("contact_profile")
+
+
+_users = _ContactProfileUserManager()
+_users.model = UserModel
+
+
+class ContactProfileBackend(ModelBackend):
+    """ModelBackend that loads the linked portal contact with the user.
+
+    Both the login form and every portal request read ``user.contact_profile``,
+    so joining it here saves a query each time.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        # ModelBackend.authenticate, with the lookup going through the joined manager.
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = _users.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_user(self, user_id):
+        try:
+            user = _users.get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
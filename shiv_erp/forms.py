@@ -5,13 +5,21 @@ from django import forms
 from .models import Budget, BudgetPeriod, Payment
 
 
+def active_period_queryset():
+    return BudgetPeriod.objects.filter(is_active=True).only("id", "name", "start_date", "end_date")
+
+
 class BudgetReportForm(forms.Form):
-    period = forms.ModelChoiceField(queryset=BudgetPeriod.objects.filter(is_active=True), required=False)
+    period = forms.ModelChoiceField(queryset=BudgetPeriod.objects.none(), required=False)
     kind = forms.ChoiceField(choices=[("", "All")] + list(Budget.Kind.choices), required=False)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["period"].queryset = active_period_queryset()
+
 
 class QuickEntryForm(forms.Form):
-    period = forms.ModelChoiceField(queryset=BudgetPeriod.objects.filter(is_active=True), required=False)
+    period = forms.ModelChoiceField(queryset=BudgetPeriod.objects.none(), required=False)
     kind = forms.ChoiceField(choices=Budget.Kind.choices)
     cost_center_name = forms.CharField(max_length=255)
     cost_center_code = forms.CharField(max_length=50, required=False)
@@ -20,6 +28,7 @@ class QuickEntryForm(forms.Form):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.fields["period"].queryset = active_period_queryset()
         self.fields["period"].widget.attrs.update({"class": "form-select"})
         self.fields["kind"].widget.attrs.update({"class": "form-select"})
         self.fields["cost_center_name"].widget.attrs.update({"class": "form-control"})
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-15 21:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shiv_erp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['doc_type', 'status', 'issue_date'], name='doc_type_status_issue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['status', 'issue_date'], name='doc_status_issue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentline',
+            index=models.Index(fields=['analytic_account', 'document'], name='docline_analytic_doc_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-15 21:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shiv_erp', '0002_document_reporting_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('doc_type', models.CharField(choices=[('po', 'Purchase Order'), ('so', 'Sales Order'), ('vendor_bill', 'Vendor Bill'), ('customer_invoice', 'Customer Invoice')], max_length=30, unique=True)),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
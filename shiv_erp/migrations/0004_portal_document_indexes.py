@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-15 22:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shiv_erp', '0003_documentsequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['contact', 'doc_type', '-issue_date', '-created_at'], name='doc_contact_type_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(condition=models.Q(('status', 'posted')), fields=['contact', 'due_date'], name='doc_contact_posted_due_idx'),
+        ),
+    ]
@@ -1,15 +1,68 @@
 from __future__ import annotations
 
-import uuid
+import threading
+from contextlib import contextmanager
+from functools import partial
 from decimal import Decimal
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Q, Sum
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 
 
+_CENT = Decimal("0.01")
+_ZERO = Decimal("0.00")
+_HUNDRED = Decimal("100")
+_EPSILON = Decimal("0.0001")
+
+_totals_state = threading.local()
+_report_cache_state = threading.local()
+
+
+@contextmanager
+def defer_totals_recalculation():
+    """Suppress the per-row document totals refresh; callers recalculate once afterwards."""
+    previous = getattr(_totals_state, "deferred", False)
+    _totals_state.deferred = True
+    try:
+        yield
+    finally:
+        _totals_state.deferred = previous
+
+
+def totals_recalculation_deferred() -> bool:
+    return getattr(_totals_state, "deferred", False)
+
+
+def report_cache_version() -> str:
+    # Kept in the database so every worker sees the same version, and only
+    # after the writes that changed it are committed.
+    version = ReportCacheVersion.objects.filter(pk=1).values_list("value", flat=True).first()
+    return str(version or 0)
+
+
+def _bump_report_cache_version(pending: dict) -> None:
+    if pending["done"]:
+        return
+    pending["done"] = True
+    if not ReportCacheVersion.objects.filter(pk=1).update(value=F("value") + 1):
+        ReportCacheVersion.objects.get_or_create(pk=1, defaults={"value": 1})
+
+
+def invalidate_report_cache(**kwargs) -> None:
+    # Every write in a transaction shares one pending bump, so a commit costs a single UPDATE
+    # even if some of the hooks are dropped by savepoint rollbacks.
+    pending = getattr(_report_cache_state, "pending", None)
+    if pending is None or pending["done"]:
+        pending = _report_cache_state.pending = {"done": False}
+    transaction.on_commit(partial(_bump_report_cache_version, pending))
+
+
 class TimestampedModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -83,6 +136,34 @@ class BudgetPeriod(TimestampedModel):
         return f"{self.name} ({self.start_date} to {self.end_date})"
 
 
+class BudgetQuerySet(models.QuerySet):
+    def with_actuals(self) -> "BudgetQuerySet":
+        actual_sq = (
+            DocumentLine.objects.filter(
+                analytic_account=OuterRef("analytic_account"),
+                document__doc_type=OuterRef("actual_doc_type_db"),
+                document__status=Document.Status.POSTED,
+                document__issue_date__gte=OuterRef("period__start_date"),
+                document__issue_date__lte=OuterRef("period__end_date"),
+            )
+            .order_by()
+            .values("analytic_account")
+            .annotate(total=Sum("line_total"))
+            .values("total")
+        )
+        return self.annotate(
+            actual_doc_type_db=Case(
+                When(kind=Budget.Kind.EXPENSE, then=Value(Document.Type.VENDOR_BILL)),
+                default=Value(Document.Type.CUSTOMER_INVOICE),
+            ),
+            actual_amount_db=Coalesce(
+                Subquery(actual_sq, output_field=DecimalField(max_digits=14, decimal_places=2)),
+                Value(_ZERO),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+        )
+
+
 class Budget(TimestampedModel):
     class Kind(models.TextChoices):
         EXPENSE = "expense", "Expense"
@@ -94,6 +175,8 @@ class Budget(TimestampedModel):
     amount = models.DecimalField(max_digits=14, decimal_places=2)
     is_active = models.BooleanField(default=True)
 
+    objects = BudgetQuerySet.as_manager()
+
     class Meta:
         ordering = ["-period__start_date", "analytic_account__name", "kind"]
         constraints = [
@@ -106,17 +189,21 @@ class Budget(TimestampedModel):
         return f"{self.analytic_account} / {self.period} / {self.get_kind_display()}"
 
     @property
-    def actual_amount(self) -> Decimal:
-        doc_types: list[str]
+    def actual_doc_type(self) -> str:
         if self.kind == Budget.Kind.EXPENSE:
-            doc_types = [Document.Type.VENDOR_BILL]
-        else:
-            doc_types = [Document.Type.CUSTOMER_INVOICE]
+            return Document.Type.VENDOR_BILL
+        return Document.Type.CUSTOMER_INVOICE
+
+    @property
+    def actual_amount(self) -> Decimal:
+        annotated = getattr(self, "actual_amount_db", None)
+        if annotated is not None:
+            return annotated.quantize(_CENT)
 
         agg = (
             DocumentLine.objects.filter(
                 analytic_account=self.analytic_account,
-                document__doc_type__in=doc_types,
+                document__doc_type=self.actual_doc_type,
                 document__status=Document.Status.POSTED,
                 document__issue_date__gte=self.period.start_date,
                 document__issue_date__lte=self.period.end_date,
@@ -124,27 +211,27 @@ class Budget(TimestampedModel):
             .aggregate(total=Sum("line_total"))
             .get("total")
         )
-        return (agg or Decimal("0.00")).quantize(Decimal("0.01"))
+        return (agg or _ZERO).quantize(_CENT)
 
     @property
     def variance(self) -> Decimal:
-        return (self.amount - self.actual_amount).quantize(Decimal("0.01"))
+        return (self.amount - self.actual_amount).quantize(_CENT)
 
     @property
     def achievement_percent(self) -> Decimal:
         if self.amount == 0:
-            return Decimal("0.00")
+            return _ZERO
         if self.kind == Budget.Kind.EXPENSE:
             used = self.actual_amount
-            return (used / self.amount * Decimal("100")).quantize(Decimal("0.01"))
+            return (used / self.amount * _HUNDRED).quantize(_CENT)
         achieved = self.actual_amount
-        return (achieved / self.amount * Decimal("100")).quantize(Decimal("0.01"))
+        return (achieved / self.amount * _HUNDRED).quantize(_CENT)
 
     @property
     def remaining_balance(self) -> Decimal:
         if self.kind == Budget.Kind.EXPENSE:
-            return (self.amount - self.actual_amount).quantize(Decimal("0.01"))
-        return (self.amount - self.actual_amount).quantize(Decimal("0.01"))
+            return (self.amount - self.actual_amount).quantize(_CENT)
+        return (self.amount - self.actual_amount).quantize(_CENT)
 
 
 class BudgetRevision(TimestampedModel):
@@ -232,8 +319,18 @@ class Document(TimestampedModel):
         max_length=20, choices=PaymentStatus.choices, default=PaymentStatus.NOT_APPLICABLE
     )
 
+    TOTALS_FIELDS = frozenset({"total_amount", "paid_amount", "payment_status"})
+
     class Meta:
         ordering = ["-issue_date", "-created_at"]
+        indexes = [
+            models.Index(fields=["doc_type", "status", "issue_date"], name="doc_type_status_issue_idx"),
+            models.Index(fields=["status", "issue_date"], name="doc_status_issue_idx"),
+            models.Index(fields=["contact", "doc_type", "-issue_date", "-created_at"], name="doc_contact_type_recent_idx"),
+            models.Index(
+                fields=["contact", "due_date"], condition=Q(status="posted"), name="doc_contact_posted_due_idx"
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.number or "Document"
@@ -251,80 +348,149 @@ class Document(TimestampedModel):
 
     def save(self, *args, **kwargs) -> None:
         if not self.number:
-            self.number = f"{self.doc_type.upper()}-{uuid.uuid4().hex[:10].upper()}"
-        self.full_clean()
+            self.number = f"{self.doc_type.upper()}-{DocumentSequence.next_value(self.doc_type):08d}"
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or not set(update_fields) <= Document.TOTALS_FIELDS:
+            self.full_clean()
         super().save(*args, **kwargs)
 
     @property
     def is_financial(self) -> bool:
         return self.doc_type in {Document.Type.VENDOR_BILL, Document.Type.CUSTOMER_INVOICE}
 
-    def recalculate_totals(self) -> None:
+    def recalculate_totals(self, *, save: bool = True) -> None:
         total = (
-            self.lines.aggregate(total=Sum("line_total")).get("total") or Decimal("0.00")
+            self.lines.aggregate(total=Sum("line_total")).get("total") or _ZERO
         )
-        self.total_amount = total.quantize(Decimal("0.01"))
-        self.update_payment_status(save=False)
+        self.total_amount = total.quantize(_CENT)
+        self.update_payment_status(save=save)
 
     def update_payment_status(self, *, save: bool = True) -> None:
         if not self.is_financial:
-            self.paid_amount = Decimal("0.00")
+            self.paid_amount = _ZERO
             self.payment_status = Document.PaymentStatus.NOT_APPLICABLE
             if save:
+                self.updated_at = timezone.now()
                 Document.objects.filter(pk=self.pk).update(
-                    paid_amount=self.paid_amount, payment_status=self.payment_status, total_amount=self.total_amount
+                    paid_amount=self.paid_amount,
+                    payment_status=self.payment_status,
+                    total_amount=self.total_amount,
+                    updated_at=self.updated_at,
                 )
             return
         
         paid = (
             self.payments.filter(status=Payment.Status.POSTED).aggregate(total=Sum("amount")).get("total")
-            or Decimal("0.00")
+            or _ZERO
         )
-        self.paid_amount = paid.quantize(Decimal("0.01"))
+        self.paid_amount = paid.quantize(_CENT)
+        self._resolve_payment_status()
+
+        if save:
+            self.updated_at = timezone.now()
+            Document.objects.filter(pk=self.pk).update(
+                total_amount=self.total_amount,
+                paid_amount=self.paid_amount,
+                payment_status=self.payment_status,
+                updated_at=self.updated_at,
+            )
+
+    def _resolve_payment_status(self) -> None:
         if self.total_amount <= 0:
             self.payment_status = Document.PaymentStatus.NOT_PAID
         elif self.paid_amount <= 0:
             self.payment_status = Document.PaymentStatus.NOT_PAID
-        elif self.paid_amount + Decimal("0.0001") < self.total_amount:
+        elif self.paid_amount + _EPSILON < self.total_amount:
             self.payment_status = Document.PaymentStatus.PARTIALLY_PAID
         else:
             self.payment_status = Document.PaymentStatus.PAID
 
-        if save:
-            Document.objects.filter(pk=self.pk).update(
-                total_amount=self.total_amount, paid_amount=self.paid_amount, payment_status=self.payment_status
-            )
-
-    def validate_cost_centers(self) -> None:
-        missing = self.lines.filter(analytic_account__isnull=True).exists()
-        if missing:
+    @classmethod
+    def recalculate_totals_bulk(cls, doc_ids) -> None:
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return
+        line_totals = dict(
+            DocumentLine.objects.filter(document_id__in=doc_ids)
+            .order_by()
+            .values_list("document_id")
+            .annotate(total=Sum("line_total"))
+        )
+        paid_totals = dict(
+            Payment.objects.filter(document_id__in=doc_ids, status=Payment.Status.POSTED)
+            .order_by()
+            .values_list("document_id")
+            .annotate(total=Sum("amount"))
+        )
+        documents = list(cls.objects.filter(pk__in=doc_ids))
+        now = timezone.now()
+        for doc in documents:
+            doc.updated_at = now
+            doc.total_amount = (line_totals.get(doc.pk) or _ZERO).quantize(_CENT)
+            if doc.is_financial:
+                doc.paid_amount = (paid_totals.get(doc.pk) or _ZERO).quantize(_CENT)
+                doc._resolve_payment_status()
+            else:
+                doc.paid_amount = _ZERO
+                doc.payment_status = Document.PaymentStatus.NOT_APPLICABLE
+        cls.objects.bulk_update(documents, ["total_amount", "paid_amount", "payment_status", "updated_at"])
+        invalidate_report_cache()
+
+    def validate_cost_centers(self, *, unassigned_lines: int | None = None) -> None:
+        if unassigned_lines is None:
+            unassigned_lines = self.lines.filter(analytic_account__isnull=True).count()
+        if unassigned_lines:
             raise ValidationError("All lines must be linked to an analytical account (cost center).")
 
-    def confirm(self) -> None:
+    def _assign_cost_centers(self, rules: "list[AutoAnalyticalRule] | None") -> None:
+        # services imports this module, so the dependency is resolved at call time.
+        from . import services
+
+        result = services.apply_auto_analytics(document=self, rules=rules)
+        self.validate_cost_centers(unassigned_lines=result.unassigned_lines)
+
+    def confirm(self, *, rules: "list[AutoAnalyticalRule] | None" = None) -> None:
         if self.status != Document.Status.DRAFT:
             raise ValidationError("Only draft documents can be confirmed.")
-        from .services import apply_auto_analytics
-
-        apply_auto_analytics(document=self)
-        self.validate_cost_centers()
+        self._assign_cost_centers(rules)
         self.status = Document.Status.CONFIRMED
         self.save()
 
-    def post(self) -> None:
+    def post(self, *, rules: "list[AutoAnalyticalRule] | None" = None) -> None:
         if self.doc_type not in {Document.Type.VENDOR_BILL, Document.Type.CUSTOMER_INVOICE}:
             raise ValidationError("Only bills and invoices can be posted.")
         if self.status not in {Document.Status.DRAFT, Document.Status.CONFIRMED}:
             raise ValidationError("Only draft or confirmed documents can be posted.")
-        from .services import apply_auto_analytics
-
-        apply_auto_analytics(document=self)
-        self.validate_cost_centers()
+        self._assign_cost_centers(rules)
         self.status = Document.Status.POSTED
         self.posted_at = timezone.now()
-        self.recalculate_totals()
+        self.recalculate_totals(save=False)
         self.save()
 
 
+class DocumentSequence(TimestampedModel):
+    doc_type = models.CharField(max_length=30, choices=Document.Type.choices, unique=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.get_doc_type_display()} #{self.last_value}"
+
+    @classmethod
+    def next_value(cls, doc_type: str) -> int:
+        with transaction.atomic():
+            sequence, _ = cls.objects.select_for_update().get_or_create(doc_type=doc_type)
+            sequence.last_value += 1
+            sequence.save(update_fields=["last_value", "updated_at"])
+        return sequence.last_value
+
+
+class ReportCacheVersion(models.Model):
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"Report cache v{self.value}"
+
+
 class DocumentLine(TimestampedModel):
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name="lines")
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
@@ -336,6 +502,7 @@ class DocumentLine(TimestampedModel):
 
     class Meta:
         ordering = ["id"]
+        indexes = [models.Index(fields=["analytic_account", "document"], name="docline_analytic_doc_idx")]
 
     def __str__(self) -> str:
         return f"{self.document} line"
@@ -347,13 +514,13 @@ class DocumentLine(TimestampedModel):
             raise ValidationError("Unit price cannot be negative.")
 
     def save(self, *args, **kwargs) -> None:
-        if self.product and (not self.description):
+        if self.product_id and (not self.description):
             self.description = self.product.name
-        self.line_total = (self.quantity * self.unit_price).quantize(Decimal("0.01"))
-        self.full_clean()
+        self.line_total = (self.quantity * self.unit_price).quantize(_CENT)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or {"quantity", "unit_price"} & set(update_fields):
+            self.clean()
         super().save(*args, **kwargs)
-        self.document.recalculate_totals()
-        self.document.save()
 
 
 class Payment(TimestampedModel):
@@ -380,13 +547,32 @@ class Payment(TimestampedModel):
         return f"{self.document} payment {self.amount}"
 
     def clean(self) -> None:
-        if not self.document.is_financial:
+        if not self._document_is_financial():
             raise ValidationError("Payments can only be recorded against invoices or bills.")
         if self.amount <= 0:
             raise ValidationError("Payment amount must be greater than zero.")
 
+    def _document_is_financial(self) -> bool:
+        if Payment.document.is_cached(self):
+            return self.document.is_financial
+        return Document.objects.filter(
+            pk=self.document_id, doc_type__in=[Document.Type.VENDOR_BILL, Document.Type.CUSTOMER_INVOICE]
+        ).exists()
+
     def save(self, *args, **kwargs) -> None:
-        self.full_clean()
+        # clean() checks the document itself; skip the separate foreign key existence query.
+        self.full_clean(exclude=["document"])
         super().save(*args, **kwargs)
-        self.document.recalculate_totals()
-        self.document.save()
+
+
+@receiver(post_save, sender=DocumentLine)
+@receiver(post_save, sender=Payment)
+def refresh_document_totals(sender, instance, raw: bool = False, **kwargs) -> None:
+    if raw or totals_recalculation_deferred():
+        return
+    instance.document.recalculate_totals()
+
+
+for _model in (AnalyticalAccount, BudgetPeriod, Budget, Document, DocumentLine, Payment):
+    post_save.connect(invalidate_report_cache, sender=_model, dispatch_uid=f"report_cache_save_{_model.__name__}")
+    post_delete.connect(invalidate_report_cache, sender=_model, dispatch_uid=f"report_cache_delete_{_model.__name__}")
@@ -1,51 +1,133 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from decimal import Decimal
 
 from django.db import transaction
+from django.db.models import BigIntegerField, Case, Count, Q, Value, When
+from django.utils import timezone
 
-from .models import AutoAnalyticalRule, Document, DocumentLine
+from .models import (
+    AutoAnalyticalRule,
+    Budget,
+    BudgetPeriod,
+    Document,
+    DocumentLine,
+    Product,
+    invalidate_report_cache,
+)
 
 
 @dataclass(frozen=True)
 class AutoAnalyticsResult:
     updated_lines: int
     applied_rule_ids: set[int]
+    unassigned_lines: int = 0
 
 
-@transaction.atomic
-def apply_auto_analytics(*, document: Document) -> AutoAnalyticsResult:
-    rules = list(
-        AutoAnalyticalRule.objects.filter(is_active=True, transaction_type=document.doc_type).order_by("priority", "id")
+def load_auto_analytical_rules(transaction_types) -> list[AutoAnalyticalRule]:
+    return list(
+        AutoAnalyticalRule.objects.filter(is_active=True, transaction_type__in=list(transaction_types))
+        .only(
+            "id",
+            "transaction_type",
+            "match_contact",
+            "match_product",
+            "match_product_category",
+            "assign_analytic_account",
+        )
+        .order_by("priority", "id")
     )
-    if not rules:
-        return AutoAnalyticsResult(updated_lines=0, applied_rule_ids=set())
 
-    updated_lines = 0
-    applied_rule_ids: set[int] = set()
 
-    lines = list(DocumentLine.objects.select_related("product").filter(document=document))
-    for line in lines:
-        if line.analytic_account_id:
-            continue
-        for rule in rules:
-            if rule.matches(document=document, line=line):
-                line.analytic_account = rule.assign_analytic_account
-                line.save(update_fields=["analytic_account", "line_total", "description", "updated_at"])
-                updated_lines += 1
-                applied_rule_ids.add(rule.id)
-                break
+@transaction.atomic
+def apply_auto_analytics(
+    *, document: Document, rules: list[AutoAnalyticalRule] | None = None
+) -> AutoAnalyticsResult:
+    if rules is None:
+        rules = load_auto_analytical_rules([document.doc_type])
+    else:
+        rules = [rule for rule in rules if rule.transaction_type == document.doc_type]
+    pending = DocumentLine.objects.filter(document=document, analytic_account__isnull=True)
+    if not rules:
+        return AutoAnalyticsResult(updated_lines=0, applied_rule_ids=set(), unassigned_lines=pending.count())
 
+    rule_whens: list[When] = []
+    assign_whens: list[When] = []
     for rule in rules:
-        if rule.matches(document=document, line=None):
-            for line in lines:
-                if not line.analytic_account_id:
-                    line.analytic_account = rule.assign_analytic_account
-                    line.save(update_fields=["analytic_account", "line_total", "description", "updated_at"])
-                    updated_lines += 1
-            if updated_lines:
-                applied_rule_ids.add(rule.id)
-            break
-
-    return AutoAnalyticsResult(updated_lines=updated_lines, applied_rule_ids=applied_rule_ids)
+        if rule.match_contact_id and document.contact_id != rule.match_contact_id:
+            continue
+        condition = Q(pk__isnull=False)
+        if rule.match_product_id:
+            condition &= Q(product_id=rule.match_product_id)
+        if rule.match_product_category:
+            condition &= Q(product_id__in=Product.objects.filter(category=rule.match_product_category).values("id"))
+        rule_whens.append(When(condition, then=Value(rule.id)))
+        assign_whens.append(When(condition, then=Value(rule.assign_analytic_account_id)))
+    if not rule_whens:
+        return AutoAnalyticsResult(updated_lines=0, applied_rule_ids=set(), unassigned_lines=pending.count())
+
+    matched = dict(
+        pending.annotate(rule_id=Case(*rule_whens, output_field=BigIntegerField()))
+        .order_by()
+        .values_list("rule_id")
+        .annotate(lines=Count("id"))
+    )
+    unassigned_lines = matched.pop(None, 0)
+    if matched:
+        pending.update(
+            analytic_account_id=Case(*assign_whens, output_field=BigIntegerField()),
+            updated_at=timezone.now(),
+        )
+        invalidate_report_cache()
+
+    return AutoAnalyticsResult(
+        updated_lines=sum(matched.values()), applied_rule_ids=set(matched), unassigned_lines=unassigned_lines
+    )
 
+
+@dataclass(frozen=True)
+class BudgetReportRow:
+    budget: Budget
+
+    @property
+    def actual(self) -> Decimal:
+        return self.budget.actual_amount
+
+    @property
+    def variance(self) -> Decimal:
+        return self.budget.variance
+
+    @property
+    def achievement_percent(self) -> Decimal:
+        return self.budget.achievement_percent
+
+    @property
+    def remaining_balance(self) -> Decimal:
+        return self.budget.remaining_balance
+
+
+def budget_report_rows(*, period: BudgetPeriod | None = None, kind: str | None = None) -> list[BudgetReportRow]:
+    """Active budgets with their actuals for the budget report view, loaded in one query.
+
+    Figures come from the Budget properties, which read the ``with_actuals()`` annotation.
+    """
+    budgets = (
+        Budget.objects.filter(is_active=True)
+        .select_related("analytic_account", "period")
+        .only(
+            "amount",
+            "kind",
+            "analytic_account__name",
+            "analytic_account__code",
+            "period__name",
+            "period__start_date",
+            "period__end_date",
+        )
+        .with_actuals()
+    )
+    if period is not None:
+        budgets = budgets.filter(period=period)
+    if kind:
+        budgets = budgets.filter(kind=kind)
+    return [BudgetReportRow(budget=budget) for budget in budgets]
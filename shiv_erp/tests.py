@@ -1,10 +1,29 @@
+import warnings
 from decimal import Decimal
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.test import Client, TestCase
 from django.urls import reverse
 
-from .models import AnalyticalAccount, Budget, BudgetPeriod, Contact, Document, DocumentLine
+from .backends import ContactProfileBackend
+from .models import (
+    AnalyticalAccount,
+    AutoAnalyticalRule,
+    Budget,
+    BudgetPeriod,
+    Contact,
+    Document,
+    DocumentLine,
+    Payment,
+    Product,
+    defer_totals_recalculation,
+    report_cache_version,
+)
+from .services import apply_auto_analytics, budget_report_rows
 
 
 class BudgetActualsTests(TestCase):
@@ -22,6 +41,169 @@ class BudgetActualsTests(TestCase):
 
         self.assertEqual(budget.actual_amount, Decimal("250.00"))
 
+    def test_with_actuals_annotation_matches_property(self):
+        analytic = AnalyticalAccount.objects.create(name="Showroom", code="SR")
+        period = BudgetPeriod.objects.create(name="Feb 2026", start_date="2026-02-01", end_date="2026-02-28")
+        expense = Budget.objects.create(analytic_account=analytic, period=period, kind=Budget.Kind.EXPENSE, amount=500)
+        revenue = Budget.objects.create(analytic_account=analytic, period=period, kind=Budget.Kind.REVENUE, amount=900)
+
+        vendor = Contact.objects.create(name="Vendor B", contact_type=Contact.Type.VENDOR)
+        bill = Document.objects.create(doc_type=Document.Type.VENDOR_BILL, contact=vendor, issue_date="2026-02-10")
+        DocumentLine.objects.create(
+            document=bill, description="Paint", quantity=2, unit_price=Decimal("40.00"), analytic_account=analytic
+        )
+        bill.post()
+
+        annotated = {b.pk: b.actual_amount_db for b in Budget.objects.with_actuals()}
+        self.assertEqual(annotated[expense.pk], Decimal("80.00"))
+        self.assertEqual(annotated[revenue.pk], Decimal("0.00"))
+
+        budgets = list(Budget.objects.with_actuals())
+        with self.assertNumQueries(0):
+            self.assertEqual([b.actual_amount for b in budgets], [annotated[b.pk] for b in budgets])
+
+        with self.assertNumQueries(1):
+            rows = {row.budget.pk: row for row in budget_report_rows(period=period, kind=Budget.Kind.EXPENSE)}
+        self.assertEqual(list(rows), [expense.pk])
+        self.assertEqual(rows[expense.pk].variance, Decimal("420.00"))
+        self.assertEqual(rows[expense.pk].achievement_percent, Decimal("16.00"))
+
+    def test_budget_changelist_shows_actual_amount_to_the_cent(self):
+        User.objects.create_superuser(username="admin", email="admin@example.com", password="pw")
+        analytic = AnalyticalAccount.objects.create(name="Polish", code="PL")
+        period = BudgetPeriod.objects.create(name="Mar 2026", start_date="2026-03-01", end_date="2026-03-31")
+        Budget.objects.create(analytic_account=analytic, period=period, kind=Budget.Kind.EXPENSE, amount=100)
+        vendor = Contact.objects.create(name="Vendor P", contact_type=Contact.Type.VENDOR)
+        bill = Document.objects.create(doc_type=Document.Type.VENDOR_BILL, contact=vendor, issue_date="2026-03-10")
+        for _ in range(3):
+            DocumentLine.objects.create(
+                document=bill, description="Lacquer", unit_price=Decimal("33.33"), analytic_account=analytic
+            )
+        bill.post()
+
+        c = Client()
+        c.login(username="admin", password="pw")
+        resp = c.get(reverse("admin:shiv_erp_budget_changelist"))
+        self.assertContains(resp, '<td class="field-actual_amount">99.99</td>', html=True)
+        self.assertNotContains(resp, "99.990")
+
+
+class DocumentTotalsTests(TestCase):
+    def test_deferred_lines_are_totalled_in_bulk(self):
+        customer = Contact.objects.create(name="Customer A", contact_type=Contact.Type.CUSTOMER)
+        invoice = Document.objects.create(doc_type=Document.Type.CUSTOMER_INVOICE, contact=customer)
+        order = Document.objects.create(doc_type=Document.Type.SALES_ORDER, contact=customer)
+        with defer_totals_recalculation():
+            for doc in (invoice, order):
+                DocumentLine.objects.create(document=doc, quantity=2, unit_price=Decimal("30.00"))
+                DocumentLine.objects.create(document=doc, quantity=1, unit_price=Decimal("15.00"))
+            Payment.objects.create(document=invoice, amount=Decimal("25.00"))
+
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total_amount, Decimal("0.00"))
+        invoice_touched_at = invoice.updated_at
+
+        Document.recalculate_totals_bulk([invoice.pk, order.pk])
+        invoice.refresh_from_db()
+        order.refresh_from_db()
+        self.assertGreater(invoice.updated_at, invoice_touched_at)
+        self.assertEqual(invoice.total_amount, Decimal("75.00"))
+        self.assertEqual(invoice.paid_amount, Decimal("25.00"))
+        self.assertEqual(invoice.payment_status, Document.PaymentStatus.PARTIALLY_PAID)
+        self.assertEqual(order.total_amount, Decimal("75.00"))
+        self.assertEqual(order.payment_status, Document.PaymentStatus.NOT_APPLICABLE)
+
+    def test_payment_touches_document_updated_at(self):
+        customer = Contact.objects.create(name="Customer A", contact_type=Contact.Type.CUSTOMER)
+        invoice = Document.objects.create(doc_type=Document.Type.CUSTOMER_INVOICE, contact=customer)
+        DocumentLine.objects.create(document=invoice, quantity=1, unit_price=Decimal("40.00"))
+        invoice.refresh_from_db()
+        touched_at = invoice.updated_at
+
+        Payment.objects.create(document=invoice, amount=Decimal("40.00"))
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.payment_status, Document.PaymentStatus.PAID)
+        self.assertGreater(invoice.updated_at, touched_at)
+
+    def test_line_save_rejects_negative_quantity(self):
+        customer = Contact.objects.create(name="Customer A", contact_type=Contact.Type.CUSTOMER)
+        invoice = Document.objects.create(doc_type=Document.Type.CUSTOMER_INVOICE, contact=customer)
+        with self.assertRaises(ValidationError):
+            DocumentLine.objects.create(document=invoice, quantity=-1, unit_price=Decimal("10.00"))
+        self.assertFalse(invoice.lines.exists())
+
+    def test_payment_requires_financial_document(self):
+        customer = Contact.objects.create(name="Customer A", contact_type=Contact.Type.CUSTOMER)
+        order = Document.objects.create(doc_type=Document.Type.SALES_ORDER, contact=customer)
+        with self.assertRaises(ValidationError):
+            Payment.objects.create(document=order, amount=Decimal("10.00"))
+        with self.assertRaises(ValidationError):
+            Payment.objects.create(document_id=order.pk, amount=Decimal("10.00"))
+
+
+class DocumentNumberingTests(TestCase):
+    def test_numbers_are_sequential_per_document_type(self):
+        vendor = Contact.objects.create(name="Vendor A", contact_type=Contact.Type.VENDOR)
+        first = Document.objects.create(doc_type=Document.Type.VENDOR_BILL, contact=vendor)
+        order = Document.objects.create(doc_type=Document.Type.PURCHASE_ORDER, contact=vendor)
+        second = Document.objects.create(doc_type=Document.Type.VENDOR_BILL, contact=vendor)
+
+        self.assertEqual(first.number, "VENDOR_BILL-00000001")
+        self.assertEqual(second.number, "VENDOR_BILL-00000002")
+        self.assertEqual(order.number, "PO-00000001")
+
+
+class AutoAnalyticsTests(TestCase):
+    def test_rules_assign_unlinked_lines_by_priority(self):
+        workshop = AnalyticalAccount.objects.create(name="Workshop", code="WS")
+        general = AnalyticalAccount.objects.create(name="General", code="GEN")
+        timber = Product.objects.create(name="Teak", category="Timber")
+        glue = Product.objects.create(name="Glue", category="Consumables")
+        vendor = Contact.objects.create(name="Vendor A", contact_type=Contact.Type.VENDOR)
+        AutoAnalyticalRule.objects.create(
+            name="Timber",
+            priority=1,
+            transaction_type=AutoAnalyticalRule.TransactionType.VENDOR_BILL,
+            match_product_category="Timber",
+            assign_analytic_account=workshop,
+        )
+        fallback = AutoAnalyticalRule.objects.create(
+            name="Fallback",
+            priority=5,
+            transaction_type=AutoAnalyticalRule.TransactionType.VENDOR_BILL,
+            assign_analytic_account=general,
+        )
+
+        bill = Document.objects.create(doc_type=Document.Type.VENDOR_BILL, contact=vendor)
+        teak_line = DocumentLine.objects.create(document=bill, product=timber, unit_price=Decimal("10.00"))
+        glue_line = DocumentLine.objects.create(document=bill, product=glue, unit_price=Decimal("2.00"))
+        linked_line = DocumentLine.objects.create(
+            document=bill, description="Freight", unit_price=Decimal("5.00"), analytic_account=workshop
+        )
+
+        result = apply_auto_analytics(document=bill)
+
+        self.assertEqual(result.updated_lines, 2)
+        self.assertEqual(len(result.applied_rule_ids), 2)
+        self.assertIn(fallback.id, result.applied_rule_ids)
+        self.assertEqual(result.unassigned_lines, 0)
+        teak_line.refresh_from_db()
+        glue_line.refresh_from_db()
+        linked_line.refresh_from_db()
+        self.assertEqual(teak_line.analytic_account, workshop)
+        self.assertEqual(glue_line.analytic_account, general)
+        self.assertEqual(linked_line.analytic_account, workshop)
+
+    def test_post_rejects_lines_without_cost_center(self):
+        vendor = Contact.objects.create(name="Vendor A", contact_type=Contact.Type.VENDOR)
+        bill = Document.objects.create(doc_type=Document.Type.VENDOR_BILL, contact=vendor)
+        DocumentLine.objects.create(document=bill, description="Nails", unit_price=Decimal("3.00"))
+
+        with self.assertRaises(ValidationError):
+            bill.post()
+        bill.refresh_from_db()
+        self.assertEqual(bill.status, Document.Status.DRAFT)
+
 
 class PortalSecurityTests(TestCase):
     def test_portal_user_cannot_view_other_contact_document(self):
@@ -48,6 +230,21 @@ class ContactAdminTests(TestCase):
         from .admin import DocumentInline
         self.assertTrue(any(isinstance(inline, DocumentInline) for inline in contact_admin.get_inline_instances(None)))
 
+    def test_document_inline_is_capped_to_recent_documents(self):
+        User.objects.create_superuser(username="admin", email="admin@example.com", password="pw")
+        contact = Contact.objects.create(name="Busy Customer", contact_type=Contact.Type.CUSTOMER)
+        for _ in range(30):
+            Document.objects.create(doc_type=Document.Type.CUSTOMER_INVOICE, contact=contact)
+
+        c = Client()
+        c.login(username="admin", password="pw")
+        resp = c.get(reverse("admin:shiv_erp_contact_change", args=[contact.pk]))
+
+        self.assertEqual(resp.status_code, 200)
+        formset = resp.context["inline_admin_formsets"][0].formset
+        self.assertEqual(len(formset.forms), 25)
+        self.assertContains(resp, "View 30 documents")
+
 
 class PortalDashboardTests(TestCase):
     def test_dashboard_shows_correct_counts_and_invoice_rows(self):
@@ -101,6 +298,161 @@ class PortalDocumentsTests(TestCase):
         self.assertEqual(resp.context["invoice_count"], 3)
         self.assertEqual(len(resp.context["invoice_rows"]), 3)
 
+    def test_document_pdf_download(self):
+        user = User.objects.create_user(username="p3", password="pw")
+        contact = Contact.objects.create(name="C3", contact_type=Contact.Type.CUSTOMER, user=user)
+        invoice = Document.objects.create(doc_type=Document.Type.CUSTOMER_INVOICE, contact=contact)
+        DocumentLine.objects.create(document=invoice, description="Sofa", unit_price=Decimal("499.00"))
+
+        c = Client()
+        c.login(username="p3", password="pw")
+        resp = c.get(reverse("portal_document_pdf", kwargs={"number": invoice.number}))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "application/pdf")
+        self.assertEqual(resp["Content-Disposition"], f'attachment; filename="{invoice.number}.pdf"')
+        self.assertTrue(resp.content.startswith(b"%PDF"))
+
+    def test_document_pdf_filename_is_escaped(self):
+        user = User.objects.create_user(username="p4", password="pw")
+        contact = Contact.objects.create(name="C4", contact_type=Contact.Type.CUSTOMER, user=user)
+        Document.objects.create(doc_type=Document.Type.CUSTOMER_INVOICE, contact=contact, number='INV-"2026"')
+        Document.objects.create(doc_type=Document.Type.CUSTOMER_INVOICE, contact=contact, number="INV-№7")
+
+        c = Client()
+        c.login(username="p4", password="pw")
+        resp = c.get(reverse("portal_document_pdf", kwargs={"number": 'INV-"2026"'}))
+        self.assertEqual(resp["Content-Disposition"], 'attachment; filename="INV-\\"2026\\".pdf"')
+        resp = c.get(reverse("portal_document_pdf", kwargs={"number": "INV-№7"}))
+        self.assertEqual(resp["Content-Disposition"], "attachment; filename*=utf-8''INV-%E2%84%967.pdf")
+
+
+class BudgetReportTests(TestCase):
+    def setUp(self):
+        # The report cache is shared across tests and its version never moves inside TestCase.
+        cache.clear()
+        User.objects.create_user(username="staff", password="pw", is_staff=True)
+        self.analytic = AnalyticalAccount.objects.create(name="Workshop", code="WS")
+        self.period = BudgetPeriod.objects.create(name="Jan 2026", start_date="2026-01-01", end_date="2026-01-31")
+        self.budget = Budget.objects.create(
+            analytic_account=self.analytic, period=self.period, kind=Budget.Kind.EXPENSE, amount=Decimal("200.00")
+        )
+        vendor = Contact.objects.create(name="Vendor A", contact_type=Contact.Type.VENDOR)
+        bill = Document.objects.create(
+            doc_type=Document.Type.VENDOR_BILL, contact=vendor, issue_date="2026-01-10", due_date="2026-01-20"
+        )
+        DocumentLine.objects.create(
+            document=bill, description="Wood", unit_price=Decimal("250.00"), analytic_account=self.analytic
+        )
+        bill.post()
+        self.client.login(username="staff", password="pw")
+
+    def test_report_rows_use_posted_actuals(self):
+        resp = self.client.get(reverse("budget_report"), {"period": self.period.pk})
+
+        self.assertEqual(resp.status_code, 200)
+        [row] = resp.context["rows"]
+        self.assertEqual(row.budget, self.budget)
+        self.assertEqual(row.actual, Decimal("250.00"))
+        self.assertEqual(row.variance, Decimal("-50.00"))
+        self.assertEqual(row.achievement_percent, Decimal("125.00"))
+        self.assertEqual(resp.context["chart_actuals"], [250.0])
+        self.assertIn("Workshop", " ".join(alert["title"] for alert in resp.context["alerts"]))
+
+    def test_cached_report_is_refreshed_after_new_postings(self):
+        url = reverse("budget_report")
+        self.assertEqual(self.client.get(url, {"period": self.period.pk}).context["rows"][0].actual, Decimal("250.00"))
+
+        vendor = Contact.objects.get(name="Vendor A")
+        with self.captureOnCommitCallbacks(execute=True):
+            bill = Document.objects.create(doc_type=Document.Type.VENDOR_BILL, contact=vendor, issue_date="2026-01-12")
+            DocumentLine.objects.create(
+                document=bill, description="Glue", unit_price=Decimal("25.00"), analytic_account=self.analytic
+            )
+            bill.post()
+
+        resp = self.client.get(url, {"period": self.period.pk})
+        self.assertEqual(resp.context["rows"][0].actual, Decimal("275.00"))
+
+    def test_report_cache_is_invalidated_only_after_commit(self):
+        version = report_cache_version()
+        vendor = Contact.objects.get(name="Vendor A")
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                bill = Document.objects.create(
+                    doc_type=Document.Type.VENDOR_BILL, contact=vendor, issue_date="2026-01-12"
+                )
+                DocumentLine.objects.create(
+                    document=bill, description="Glue", unit_price=Decimal("25.00"), analytic_account=self.analytic
+                )
+                bill.post()
+                self.assertEqual(report_cache_version(), version)
+            self.assertEqual(report_cache_version(), version)
+
+        self.assertTrue(callbacks)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(report_cache_version(), str(int(version) + 1))
+
+    def test_payment_health_overdue_and_cash_change(self):
+        customer = Contact.objects.create(name="Customer A", contact_type=Contact.Type.CUSTOMER)
+        vendor = Contact.objects.get(name="Vendor A")
+
+        def posted(doc_type, contact, issue_date, due_date, amount, payments=()):
+            doc = Document.objects.create(doc_type=doc_type, contact=contact, issue_date=issue_date, due_date=due_date)
+            DocumentLine.objects.create(
+                document=doc, description="Item", unit_price=Decimal(amount), analytic_account=self.analytic
+            )
+            doc.post()
+            for payment_date, paid in payments:
+                Payment.objects.create(document=doc, payment_date=payment_date, amount=Decimal(paid))
+            return doc
+
+        invoice = Document.Type.CUSTOMER_INVOICE
+        # January: paid on time, and paid in full but partly after the due date.
+        posted(invoice, customer, "2026-01-05", "2026-01-20", "100.00", [("2026-01-15", "100.00")])
+        posted(invoice, customer, "2026-01-06", "2026-01-20", "100.00", [("2026-01-18", "60.00"), ("2026-01-25", "40.00")])
+        # December (the previous period): cash received, plus an unpaid overdue bill.
+        posted(invoice, customer, "2025-12-05", "2025-12-20", "50.00", [("2025-12-10", "50.00")])
+        posted(Document.Type.VENDOR_BILL, vendor, "2025-12-01", "2025-12-15", "80.00")
+        # November payments fall outside both cash windows.
+        posted(invoice, customer, "2025-11-01", "2025-11-15", "30.00", [("2025-11-20", "30.00")])
+
+        resp = self.client.get(reverse("budget_report"), {"period": self.period.pk})
+
+        # January's unpaid bill, the on-time invoice and the late one: only one of three was on time.
+        self.assertEqual(resp.context["payment_health_pct"], Decimal("33.33"))
+        self.assertEqual(resp.context["cash_received"], Decimal("200.00"))
+        self.assertEqual(resp.context["cash_operating_change_pct"], Decimal("300.00"))
+        self.assertEqual(resp.context["alerts"][0]["title"], "2 overdue invoice/bill(s) pending payment")
+
+    def test_unknown_kind_is_not_part_of_the_cache_key(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", CacheKeyWarning)
+            resp = self.client.get(reverse("budget_report"), {"period": self.period.pk, "kind": "foo bar"})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context["selected_kind"], "")
+        self.assertEqual(len(resp.context["rows"]), 1)
+
+    def test_quick_entry_matches_existing_cost_center_by_code(self):
+        resp = self.client.post(
+            reverse("budget_report"),
+            {
+                "period": self.period.pk,
+                "kind": Budget.Kind.EXPENSE,
+                "cost_center_name": "Renamed Workshop",
+                "cost_center_code": "WS",
+                "budget_amount": "300.00",
+            },
+        )
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(AnalyticalAccount.objects.count(), 1)
+        self.budget.refresh_from_db()
+        self.assertEqual(self.budget.amount, Decimal("300.00"))
+        self.assertEqual(self.budget.revisions.count(), 1)
+
 
 class CustomerLoginTests(TestCase):
     def test_customer_login_rejects_staff_user(self):
@@ -114,3 +466,15 @@ class CustomerLoginTests(TestCase):
         )
         self.assertEqual(resp.status_code, 200)
         self.assertContains(resp, "Staff accounts must use the admin login.")
+
+    def test_backend_loads_contact_profile_with_user(self):
+        user = User.objects.create_user(username="cust1", password="pw")
+        Contact.objects.create(name="Customer A", contact_type=Contact.Type.CUSTOMER, user=user)
+        backend = ContactProfileBackend()
+        with self.assertNumQueries(1):
+            loaded = backend.get_user(user.pk)
+            self.assertEqual(loaded.contact_profile.name, "Customer A")
+        self.assertIsNone(backend.authenticate(None, username="cust1", password="wrong"))
+        with self.assertNumQueries(1):
+            loaded = backend.authenticate(None, username="cust1", password="pw")
+            self.assertEqual(loaded.contact_profile.name, "Customer A")
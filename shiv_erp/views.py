@@ -1,26 +1,55 @@
 from __future__ import annotations
 
 import calendar
+from functools import lru_cache
 from datetime import timedelta
 from decimal import Decimal
-from io import BytesIO
 from urllib.parse import urlencode
 
 from django.contrib import messages
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.core.cache import cache
 from django.db import transaction
-from django.db.models import F, Max, Q, Sum
-from django.http import FileResponse, Http404, HttpRequest, HttpResponse
+from django.db.models import Count, DecimalField, Exists, F, OuterRef, Q, Sum, Value
+from django.db.models.functions import Greatest
+from django.http import Http404, HttpRequest, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.urls import reverse
+from django.urls import get_script_prefix, reverse
 from django.utils import timezone
+from django.utils.http import content_disposition_header
 
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 
 from .forms import PortalPaymentForm, QuickEntryForm
-from .models import AnalyticalAccount, Budget, BudgetPeriod, BudgetRevision, Contact, Document, DocumentLine, Payment
+from .models import (
+    AnalyticalAccount,
+    Budget,
+    BudgetPeriod,
+    BudgetRevision,
+    Contact,
+    Document,
+    DocumentLine,
+    Payment,
+    defer_totals_recalculation,
+    report_cache_version,
+)
+from .services import budget_report_rows
+
+
+BUDGET_REPORT_CACHE_SECONDS = 300
+
+
+@lru_cache(maxsize=None)
+def _reverse_cached(name: str, script_prefix: str) -> str:
+    return reverse(name)
+
+
+def _url(name: str) -> str:
+    # URL names here take no arguments, so the resolved path only varies with
+    # the script prefix the site is mounted under.
+    return _reverse_cached(name, get_script_prefix())
 
 
 def staff_required(view_func):
@@ -36,6 +65,23 @@ def _portal_contact(request: HttpRequest) -> Contact:
         raise Http404()
     return contact
 
+
+def _amount_due(doc: Document) -> Decimal:
+    # Both totals are stored at two decimal places, so the difference already is.
+    due = doc.total_amount - doc.paid_amount
+    return due if due > 0 else Decimal("0.00")
+
+
+def _with_amount_due(docs):
+    return docs.annotate(
+        amount_due=Greatest(
+            F("total_amount") - F("paid_amount"),
+            Value(Decimal("0.00")),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )
+    )
+
+
 class CustomerLoginView(auth_views.LoginView):
     template_name = "shiv_erp/customer_login.html"
     redirect_authenticated_user = True
@@ -58,15 +104,15 @@ logout_view = auth_views.LogoutView.as_view()
 
 def login_choice(request: HttpRequest) -> HttpResponse:
     if request.user.is_authenticated:
-        return redirect(reverse("home"))
+        return redirect(_url("home"))
 
     next_url = request.GET.get("next") or ""
 
-    customer_login_url = reverse("customer_login")
-    admin_login_url = reverse("admin:login")
+    customer_login_url = _url("customer_login")
+    admin_login_url = _url("admin:login")
 
-    customer_next = reverse("portal_dashboard")
-    admin_next = reverse("budget_report")
+    customer_next = _url("portal_dashboard")
+    admin_next = _url("budget_report")
 
     if next_url:
         if next_url.startswith("/portal"):
@@ -87,32 +133,25 @@ def login_choice(request: HttpRequest) -> HttpResponse:
 @login_required(login_url="customer_login")
 def portal_dashboard(request: HttpRequest) -> HttpResponse:
     if request.user.is_staff:
-        return redirect(reverse("budget_report"))
+        return redirect(_url("budget_report"))
     contact = _portal_contact(request)
     all_docs = Document.objects.filter(contact=contact)
     recent_docs = all_docs.order_by("-issue_date", "-created_at")[:10]
     invoices = all_docs.filter(doc_type=Document.Type.CUSTOMER_INVOICE)
-    bills = all_docs.filter(doc_type=Document.Type.VENDOR_BILL)
     pending_docs = all_docs.filter(status=Document.Status.POSTED, total_amount__gt=F("paid_amount"))
-    invoice_list = invoices.order_by("-issue_date", "-created_at")[:10]
-    invoice_rows = []
-    for inv in invoice_list:
-        amount_due = (inv.total_amount - inv.paid_amount).quantize(Decimal("0.01"))
-        if amount_due < 0:
-            amount_due = Decimal("0.00")
-        invoice_rows.append({"doc": inv, "amount_due": amount_due})
-    pending_rows = []
-    for doc in pending_docs.order_by("due_date", "-issue_date", "-created_at")[:10]:
-        amount_due = (doc.total_amount - doc.paid_amount).quantize(Decimal("0.01"))
-        if amount_due < 0:
-            amount_due = Decimal("0.00")
-        pending_rows.append({"doc": doc, "amount_due": amount_due})
+    counts = all_docs.aggregate(
+        invoice_count=Count("pk", filter=Q(doc_type=Document.Type.CUSTOMER_INVOICE)),
+        bill_count=Count("pk", filter=Q(doc_type=Document.Type.VENDOR_BILL)),
+        pending_count=Count("pk", filter=Q(status=Document.Status.POSTED, total_amount__gt=F("paid_amount"))),
+    )
+    invoice_rows = _with_amount_due(invoices).order_by("-issue_date", "-created_at")[:10]
+    pending_rows = _with_amount_due(pending_docs).order_by("due_date", "-issue_date", "-created_at")[:10]
     context = {
         "contact": contact,
         "recent_docs": recent_docs,
-        "invoice_count": invoices.count(),
-        "bill_count": bills.count(),
-        "pending_count": pending_docs.count(),
+        "invoice_count": counts["invoice_count"],
+        "bill_count": counts["bill_count"],
+        "pending_count": counts["pending_count"],
         "pending_rows": pending_rows,
         "invoice_rows": invoice_rows,
     }
@@ -126,13 +165,8 @@ def portal_documents(request: HttpRequest, doc_type: str | None = None) -> HttpR
     qs = all_docs.order_by("-issue_date", "-created_at")
     if doc_type:
         qs = qs.filter(doc_type=doc_type)
-    invoices = all_docs.filter(doc_type=Document.Type.CUSTOMER_INVOICE).order_by("-issue_date", "-created_at")
-    invoice_rows = []
-    for inv in invoices[:10]:
-        amount_due = (inv.total_amount - inv.paid_amount).quantize(Decimal("0.01"))
-        if amount_due < 0:
-            amount_due = Decimal("0.00")
-        invoice_rows.append({"doc": inv, "amount_due": amount_due})
+    invoices = all_docs.filter(doc_type=Document.Type.CUSTOMER_INVOICE)
+    invoice_rows = _with_amount_due(invoices).order_by("-issue_date", "-created_at")[:10]
     return render(
         request,
         "shiv_erp/portal_documents.html",
@@ -156,10 +190,11 @@ def portal_document_detail(request: HttpRequest, number: str) -> HttpResponse:
 @login_required(login_url="customer_login")
 def portal_document_pdf(request: HttpRequest, number: str) -> HttpResponse:
     contact = _portal_contact(request)
-    doc = get_object_or_404(Document.objects.prefetch_related("lines"), number=number, contact=contact)
+    doc = get_object_or_404(Document, number=number, contact=contact)
 
-    buffer = BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
+    response = HttpResponse(content_type="application/pdf")
+    response["Content-Disposition"] = content_disposition_header(True, f"{doc.number}.pdf")
+    p = canvas.Canvas(response, pagesize=A4)
     width, height = A4
 
     y = height - 50
@@ -168,7 +203,7 @@ def portal_document_pdf(request: HttpRequest, number: str) -> HttpResponse:
     y -= 20
 
     p.setFont("Helvetica", 10)
-    p.drawString(40, y, f"Contact: {doc.contact.name}")
+    p.drawString(40, y, f"Contact: {contact.name}")
     y -= 15
     p.drawString(40, y, f"Date: {doc.issue_date}")
     y -= 15
@@ -185,9 +220,10 @@ def portal_document_pdf(request: HttpRequest, number: str) -> HttpResponse:
     p.drawString(490, y, "Total")
     y -= 15
     p.setFont("Helvetica", 10)
-    for line in doc.lines.all():
+    for line in doc.lines.select_related("product").iterator(chunk_size=500):
         if y < 80:
             p.showPage()
+            p.setFont("Helvetica", 10)
             y = height - 50
         desc = line.description or (line.product.name if line.product else "")
         p.drawString(40, y, desc[:55])
@@ -208,9 +244,7 @@ def portal_document_pdf(request: HttpRequest, number: str) -> HttpResponse:
 
     p.showPage()
     p.save()
-    buffer.seek(0)
-    filename = f"{doc.number}.pdf"
-    return FileResponse(buffer, as_attachment=True, filename=filename)
+    return response
 
 
 @login_required(login_url="customer_login")
@@ -222,7 +256,7 @@ def portal_pay_document(request: HttpRequest, number: str) -> HttpResponse:
     if doc.payment_status == Document.PaymentStatus.PAID:
         return redirect("portal_document_detail", number=doc.number)
 
-    remaining = (doc.total_amount - doc.paid_amount).quantize(Decimal("0.01"))
+    remaining = _amount_due(doc)
     if request.method == "POST":
         form = PortalPaymentForm(request.POST)
         if form.is_valid():
@@ -249,21 +283,39 @@ def portal_pay_document(request: HttpRequest, number: str) -> HttpResponse:
     )
 
 
+def _find_cost_center(name: str, code: str) -> AnalyticalAccount | None:
+    lookup = Q(name=name)
+    if code:
+        lookup |= Q(code=code)
+    candidates = list(AnalyticalAccount.objects.filter(lookup))
+    if code:
+        for candidate in candidates:
+            if candidate.code == code:
+                return candidate
+    return candidates[0] if candidates else None
+
+
 @staff_required
 def budget_report(request: HttpRequest) -> HttpResponse:
     period_id = request.GET.get("period")
     selected_kind = request.GET.get("kind") or ""
+    if selected_kind not in Budget.Kind.values:
+        # Unknown kinds show the unfiltered report; keep them out of the cache key.
+        selected_kind = ""
 
-    periods = BudgetPeriod.objects.filter(is_active=True).order_by("-start_date")
-    if not periods.exists():
+    periods = list(BudgetPeriod.objects.filter(is_active=True).order_by("-start_date"))
+    if not periods:
         today = timezone.localdate()
         start_date = today.replace(day=1)
         end_date = today.replace(day=calendar.monthrange(today.year, today.month)[1])
-        BudgetPeriod.objects.create(name=today.strftime("%b %Y"), start_date=start_date, end_date=end_date, is_active=True)
-        periods = BudgetPeriod.objects.filter(is_active=True).order_by("-start_date")
+        periods = [
+            BudgetPeriod.objects.create(
+                name=today.strftime("%b %Y"), start_date=start_date, end_date=end_date, is_active=True
+            )
+        ]
 
-    selected_period = periods.filter(id=period_id).first() if period_id else None
-    default_period = periods.first()
+    selected_period = next((p for p in periods if str(p.id) == period_id), None) if period_id else None
+    default_period = periods[0]
 
     quick_entry_form = QuickEntryForm(
         initial={"period": selected_period or default_period, "kind": selected_kind or Budget.Kind.EXPENSE}
@@ -280,11 +332,7 @@ def budget_report(request: HttpRequest) -> HttpResponse:
             actual_amount = quick_entry_form.cleaned_data.get("actual_amount")
 
             with transaction.atomic():
-                analytic = None
-                if cost_center_code:
-                    analytic = AnalyticalAccount.objects.filter(code=cost_center_code).first()
-                if analytic is None:
-                    analytic = AnalyticalAccount.objects.filter(name=cost_center_name).first()
+                analytic = _find_cost_center(cost_center_name, cost_center_code)
                 if analytic is None:
                     analytic = AnalyticalAccount.objects.create(name=cost_center_name, code=cost_center_code)
 
@@ -320,13 +368,14 @@ def budget_report(request: HttpRequest) -> HttpResponse:
                         issue_date=issue_date,
                         due_date=issue_date + timedelta(days=30),
                     )
-                    DocumentLine.objects.create(
-                        document=doc,
-                        description="Quick entry",
-                        quantity=Decimal("1.00"),
-                        unit_price=actual_amount,
-                        analytic_account=analytic,
-                    )
+                    with defer_totals_recalculation():
+                        DocumentLine.objects.create(
+                            document=doc,
+                            description="Quick entry",
+                            quantity=Decimal("1.00"),
+                            unit_price=actual_amount,
+                            analytic_account=analytic,
+                        )
                     doc.post()
 
             messages.success(request, "Entry saved. Dashboard updated.")
@@ -335,48 +384,60 @@ def budget_report(request: HttpRequest) -> HttpResponse:
                 qs.append(f"period={period_id}")
             if selected_kind:
                 qs.append(f"kind={selected_kind}")
-            url = reverse("budget_report")
+            url = _url("budget_report")
             if qs:
                 url = f"{url}?{'&'.join(qs)}"
             return redirect(url)
 
-    budgets = Budget.objects.filter(is_active=True).select_related("analytic_account", "period")
-    if selected_period:
-        budgets = budgets.filter(period=selected_period)
-    if selected_kind in {Budget.Kind.EXPENSE, Budget.Kind.REVENUE}:
-        budgets = budgets.filter(kind=selected_kind)
-
-    rows = []
-    labels = []
-    actuals = []
-    planned = []
-    for b in budgets:
-        labels.append(str(b.analytic_account))
-        planned.append(float(b.amount))
-        actuals.append(float(b.actual_amount))
-        rows.append(
-            {
-                "budget": b,
-                "actual": b.actual_amount,
-                "variance": b.variance,
-                "achievement": b.achievement_percent,
-                "remaining": b.remaining_balance,
-            }
-        )
+    today = timezone.localdate()
+    cache_key = ":".join(
+        [
+            "budget_report",
+            str(selected_period.pk if selected_period else ""),
+            selected_kind,
+            today.isoformat(),
+            report_cache_version(),
+        ]
+    )
+    report = cache.get(cache_key)
+    if report is None:
+        report = _budget_report_data(selected_period, selected_kind, today)
+        cache.set(cache_key, report, BUDGET_REPORT_CACHE_SECONDS)
+
+    return render(
+        request,
+        "shiv_erp/budget_report.html",
+        {
+            "periods": periods,
+            "selected_period": selected_period,
+            "selected_kind": selected_kind,
+            "kinds": Budget.Kind.choices,
+            "quick_entry_form": quick_entry_form,
+            **report,
+        },
+    )
+
+
+def _budget_report_data(selected_period: BudgetPeriod | None, selected_kind: str, today) -> dict:
+    rows = budget_report_rows(period=selected_period, kind=selected_kind)
+    budget_list = [row.budget for row in rows]
+    labels = [str(b.analytic_account) for b in budget_list]
+    planned = [float(b.amount) for b in budget_list]
+    actuals = [float(row.actual) for row in rows]
 
     def _pct(n: Decimal, d: Decimal) -> Decimal:
         if d <= 0:
             return Decimal("0.00")
         return (n / d * Decimal("100")).quantize(Decimal("0.01"))
 
-    expense_budget_total = (
-        budgets.filter(kind=Budget.Kind.EXPENSE).aggregate(total=Sum("amount")).get("total") or Decimal("0.00")
+    expense_budget_total = sum(
+        (b.amount for b in budget_list if b.kind == Budget.Kind.EXPENSE), Decimal("0.00")
     ).quantize(Decimal("0.01"))
-    revenue_budget_total = (
-        budgets.filter(kind=Budget.Kind.REVENUE).aggregate(total=Sum("amount")).get("total") or Decimal("0.00")
+    revenue_budget_total = sum(
+        (b.amount for b in budget_list if b.kind == Budget.Kind.REVENUE), Decimal("0.00")
     ).quantize(Decimal("0.01"))
 
-    analytic_ids = list(budgets.values_list("analytic_account_id", flat=True).distinct())
+    analytic_ids = list({b.analytic_account_id for b in budget_list})
     expense_actual_total = Decimal("0.00")
     revenue_actual_total = Decimal("0.00")
     if analytic_ids and selected_period:
@@ -386,16 +447,15 @@ def budget_report(request: HttpRequest) -> HttpResponse:
             document__issue_date__gte=selected_period.start_date,
             document__issue_date__lte=selected_period.end_date,
         )
-        expense_actual_total = (
-            line_qs.filter(document__doc_type=Document.Type.VENDOR_BILL).aggregate(total=Sum("line_total")).get("total")
-            or Decimal("0.00")
-        ).quantize(Decimal("0.01"))
-        revenue_actual_total = (
-            line_qs.filter(document__doc_type=Document.Type.CUSTOMER_INVOICE)
-            .aggregate(total=Sum("line_total"))
-            .get("total")
-            or Decimal("0.00")
-        ).quantize(Decimal("0.01"))
+        line_totals = dict(
+            line_qs.order_by().values_list("document__doc_type").annotate(total=Sum("line_total"))
+        )
+        expense_actual_total = (line_totals.get(Document.Type.VENDOR_BILL) or Decimal("0.00")).quantize(
+            Decimal("0.01")
+        )
+        revenue_actual_total = (line_totals.get(Document.Type.CUSTOMER_INVOICE) or Decimal("0.00")).quantize(
+            Decimal("0.01")
+        )
 
     revenue_achievement_pct = _pct(revenue_actual_total, revenue_budget_total)
     expense_used_pct = _pct(expense_actual_total, expense_budget_total)
@@ -405,46 +465,37 @@ def budget_report(request: HttpRequest) -> HttpResponse:
     if expense_control_pct > 100:
         expense_control_pct = Decimal("100.00")
 
-    payment_qs = Payment.objects.filter(status=Payment.Status.POSTED).select_related("document")
+    received_q = Q(document__doc_type=Document.Type.CUSTOMER_INVOICE)
+    paid_q = Q(document__doc_type=Document.Type.VENDOR_BILL)
+    payment_qs = Payment.objects.filter(status=Payment.Status.POSTED)
     if selected_period:
-        payment_qs = payment_qs.filter(
-            payment_date__gte=selected_period.start_date,
+        period_days = (selected_period.end_date - selected_period.start_date).days + 1
+        prev_end = selected_period.start_date - timedelta(days=1)
+        prev_start = prev_end - timedelta(days=period_days - 1)
+        current_q = Q(payment_date__gte=selected_period.start_date)
+        previous_q = Q(payment_date__lte=prev_end)
+        cash_totals = payment_qs.filter(
+            payment_date__gte=prev_start,
             payment_date__lte=selected_period.end_date,
+        ).aggregate(
+            received=Sum("amount", filter=current_q & received_q),
+            paid=Sum("amount", filter=current_q & paid_q),
+            prev_received=Sum("amount", filter=previous_q & received_q),
+            prev_paid=Sum("amount", filter=previous_q & paid_q),
+        )
+    else:
+        cash_totals = payment_qs.aggregate(
+            received=Sum("amount", filter=received_q),
+            paid=Sum("amount", filter=paid_q),
         )
 
-    cash_received = (
-        payment_qs.filter(document__doc_type=Document.Type.CUSTOMER_INVOICE).aggregate(total=Sum("amount")).get("total")
-        or Decimal("0.00")
-    ).quantize(Decimal("0.01"))
-    cash_paid = (
-        payment_qs.filter(document__doc_type=Document.Type.VENDOR_BILL).aggregate(total=Sum("amount")).get("total")
-        or Decimal("0.00")
-    ).quantize(Decimal("0.01"))
+    cash_received = (cash_totals["received"] or Decimal("0.00")).quantize(Decimal("0.01"))
+    cash_paid = (cash_totals["paid"] or Decimal("0.00")).quantize(Decimal("0.01"))
     cash_net = (cash_received - cash_paid).quantize(Decimal("0.01"))
 
     cash_operating_change_pct = None
     if selected_period:
-        period_days = (selected_period.end_date - selected_period.start_date).days + 1
-        prev_end = selected_period.start_date - timedelta(days=1)
-        prev_start = prev_end - timedelta(days=period_days - 1)
-
-        prev_payment_qs = Payment.objects.filter(
-            status=Payment.Status.POSTED,
-            payment_date__gte=prev_start,
-            payment_date__lte=prev_end,
-        ).select_related("document")
-
-        prev_received = (
-            prev_payment_qs.filter(document__doc_type=Document.Type.CUSTOMER_INVOICE)
-            .aggregate(total=Sum("amount"))
-            .get("total")
-            or Decimal("0.00")
-        )
-        prev_paid = (
-            prev_payment_qs.filter(document__doc_type=Document.Type.VENDOR_BILL).aggregate(total=Sum("amount")).get("total")
-            or Decimal("0.00")
-        )
-        prev_net = prev_received - prev_paid
+        prev_net = (cash_totals["prev_received"] or Decimal("0.00")) - (cash_totals["prev_paid"] or Decimal("0.00"))
         if prev_net != 0:
             cash_operating_change_pct = ((cash_net - prev_net) / abs(prev_net) * Decimal("100")).quantize(Decimal("0.01"))
 
@@ -453,15 +504,28 @@ def budget_report(request: HttpRequest) -> HttpResponse:
         doc_type__in=[Document.Type.VENDOR_BILL, Document.Type.CUSTOMER_INVOICE],
         due_date__isnull=False,
     )
+    # Overdue documents are counted across all periods, so the period only
+    # narrows the payment health counts.
+    in_period = Q()
     if selected_period:
-        docs_qs = docs_qs.filter(issue_date__gte=selected_period.start_date, issue_date__lte=selected_period.end_date)
-
-    docs_qs = docs_qs.annotate(
-        last_payment=Max("payments__payment_date", filter=Q(payments__status=Payment.Status.POSTED))
+        in_period = Q(issue_date__gte=selected_period.start_date, issue_date__lte=selected_period.end_date)
+
+    # Paid on time means the last posted payment landed on or before the due date.
+    posted_payments = Payment.objects.filter(document=OuterRef("pk"), status=Payment.Status.POSTED)
+    late_payments = posted_payments.filter(payment_date__gt=OuterRef("due_date"))
+    paid_on_time = Exists(posted_payments) & ~Exists(late_payments)
+
+    health = docs_qs.aggregate(
+        total=Count("pk", filter=in_period),
+        on_time=Count(
+            "pk",
+            filter=in_period & Q(payment_status=Document.PaymentStatus.PAID) & paid_on_time,
+        ),
+        overdue=Count("pk", filter=Q(due_date__lt=today) & ~Q(payment_status=Document.PaymentStatus.PAID)),
     )
-
-    docs_due_total = docs_qs.count()
-    docs_on_time = docs_qs.filter(payment_status=Document.PaymentStatus.PAID, last_payment__lte=F("due_date")).count()
+    docs_due_total = health["total"]
+    docs_on_time = health["on_time"]
+    overdue_count = health["overdue"]
     payment_health_pct = Decimal("0.00")
     if docs_due_total:
         payment_health_pct = (Decimal(docs_on_time) / Decimal(docs_due_total) * Decimal("100")).quantize(Decimal("0.01"))
@@ -475,77 +539,60 @@ def budget_report(request: HttpRequest) -> HttpResponse:
         overall_score = 100
 
     alerts: list[dict[str, str]] = []
-    today = timezone.localdate()
-    overdue_count = (
-        Document.objects.filter(
-            status=Document.Status.POSTED,
-            doc_type__in=[Document.Type.VENDOR_BILL, Document.Type.CUSTOMER_INVOICE],
-            due_date__lt=today,
-        )
-        .exclude(payment_status=Document.PaymentStatus.PAID)
-        .count()
-    )
     if overdue_count:
         alerts.append(
             {
                 "title": f"{overdue_count} overdue invoice/bill(s) pending payment",
                 "subtitle": "Follow up and record payments to keep books accurate",
-                "url": reverse("admin:shiv_erp_document_changelist"),
+                "url": _url("admin:shiv_erp_document_changelist"),
             }
         )
 
-    over_budget_count = 0
-    for b in budgets.filter(kind=Budget.Kind.EXPENSE)[:50]:
-        if b.amount > 0 and b.actual_amount > b.amount:
-            over_budget_count += 1
-            if len(alerts) < 3:
-                alerts.append(
-                    {
-                        "title": f"{b.analytic_account} is over budget",
-                        "subtitle": f"Budget {b.amount} vs Actual {b.actual_amount}",
-                        "url": reverse("budget_report"),
-                    }
-                )
+    over_budget = [
+        b
+        for b in budget_list
+        if b.kind == Budget.Kind.EXPENSE and b.amount > 0 and b.actual_amount > b.amount
+    ]
+    over_budget_count = len(over_budget)
+    for b in over_budget[: max(3 - len(alerts), 0)]:
+        alerts.append(
+            {
+                "title": f"{b.analytic_account} is over budget",
+                "subtitle": f"Budget {b.amount} vs Actual {b.actual_amount}",
+                "url": _url("budget_report"),
+            }
+        )
 
     if over_budget_count and len(alerts) < 4:
         alerts.append(
             {
                 "title": f"{over_budget_count} cost center(s) are over budget",
                 "subtitle": "Review posted bills and revise budgets if needed",
-                "url": reverse("budget_report"),
+                "url": _url("budget_report"),
             }
         )
 
-    return render(
-        request,
-        "shiv_erp/budget_report.html",
-        {
-            "periods": periods,
-            "selected_period": selected_period,
-            "selected_kind": selected_kind,
-            "rows": rows,
-            "chart_labels": labels,
-            "chart_planned": planned,
-            "chart_actuals": actuals,
-            "kinds": Budget.Kind.choices,
-            "overall_score": overall_score,
-            "revenue_achievement_pct": revenue_achievement_pct,
-            "expense_control_pct": expense_control_pct,
-            "cash_received": cash_received,
-            "cash_paid": cash_paid,
-            "cash_net": cash_net,
-            "cash_operating": cash_net,
-            "cash_operating_change_pct": cash_operating_change_pct,
-            "payment_health_pct": payment_health_pct,
-            "alerts": alerts,
-            "quick_entry_form": quick_entry_form,
-        },
-    )
+    return {
+        "rows": rows,
+        "chart_labels": labels,
+        "chart_planned": planned,
+        "chart_actuals": actuals,
+        "overall_score": overall_score,
+        "revenue_achievement_pct": revenue_achievement_pct,
+        "expense_control_pct": expense_control_pct,
+        "cash_received": cash_received,
+        "cash_paid": cash_paid,
+        "cash_net": cash_net,
+        "cash_operating": cash_net,
+        "cash_operating_change_pct": cash_operating_change_pct,
+        "payment_health_pct": payment_health_pct,
+        "alerts": alerts,
+    }
 
 
 def home_redirect(request: HttpRequest) -> HttpResponse:
     if request.user.is_authenticated:
         if request.user.is_staff:
-            return redirect(reverse("budget_report"))
-        return redirect(reverse("portal_dashboard"))
-    return redirect(reverse("login"))
+            return redirect(_url("budget_report"))
+        return redirect(_url("portal_dashboard"))
+    return redirect(_url("login"))